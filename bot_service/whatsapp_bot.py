@@ -13,17 +13,24 @@ import time
 import sqlite3
 import os
 import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
 
+# Shared helpers live at the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import ensure_schema, normalize_phone
+
 # --- Configuration ---
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'students.db')
+CHROME_PROFILE_DIR = os.path.expanduser('~/.config/aces-bot-chrome')  # One logged-in profile per group
 
 # UPDATE THESE WITH YOUR ACTUAL GROUP NAMES
 GROUPS = [
@@ -31,116 +38,157 @@ GROUPS = [
     "COE 1 {Unofficial}"     # Unofficial Group Name
 ]
 
-CHECK_INTERVAL = 60  # Seconds between checks
+CHECK_INTERVAL = int(os.getenv('BOT_CHECK_INTERVAL', '60'))  # Seconds between checks
+MAX_CHECK_INTERVAL = int(os.getenv('BOT_MAX_CHECK_INTERVAL', '600'))  # Backoff ceiling when idle
 MAX_APPROVALS_PER_CYCLE = 10  # Safety limit
+UI_TIMEOUT = 10  # Seconds to wait for a WhatsApp Web element after an action
+PENDING_TIMEOUT = 3  # Seconds to look for the pending section before giving up
+APPROVE_TIMEOUT = 2  # Seconds to wait for an approved request to leave the drawer
+
+# Various possible selectors for pending participants
+PENDING_SELECTORS = [
+    '//div[contains(text(), "Pending")]',
+    '//span[contains(text(), "Pending")]',
+    '//*[contains(text(), "Waiting")]',
+    '//div[contains(@class, "pending")]'
+]
+
+# Pending indicator on a chat-list row, matching the aria-label case-insensitively
+PENDING_BADGE_XPATH = (
+    './/span[contains(translate(@aria-label, "ABCDEFGHIJKLMNOPQRSTUVWXYZ", '
+    '"abcdefghijklmnopqrstuvwxyz"), "pending")]'
+)
+# Groups whose chat row has shown the badge this session. A missing badge only
+# skips the drawer check once the selector has proven it works for that group.
+_badge_seen = set()
+
+# Precompiled pattern used on every pending request
+_PHONE_RE = re.compile(r'[\+]?[\d\s\-]{9,15}')
+
+# Right-hand group info drawer; the chat list uses the same row markup, so
+# pending-request lookups are scoped to it
+DRAWER_SELECTOR = '[data-testid="drawer-right"]'
+
+# Collects every pending request in the drawer in one WebDriver round-trip.
+# Note: Exact selectors may change with WhatsApp Web updates
+PENDING_REQUESTS_JS = """
+const drawer = document.querySelector(arguments[0]) || document;
+let items = drawer.querySelectorAll('[data-testid="cell-frame-container"]');
+if (!items.length) {
+    items = drawer.querySelectorAll('div[class*="participant"]');
+}
+return Array.from(items).map(e => {
+    const checkmark = e.querySelector('span[data-icon="checkmark"]');
+    return {
+        title: e.getAttribute('title') || '',
+        text: e.innerText || '',
+        approve: e.querySelector('[data-testid="approve"]')
+            || (checkmark ? checkmark.parentElement : null)
+    };
+});
+"""
 
 # --- Database Functions ---
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+_CONN = None
+_DB_LOCK = threading.Lock()  # Serializes writes from the per-group worker threads
 
-def get_whitelist():
-    """Fetch all whitelisted phone numbers and normalize them."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT phone_number, app_id FROM whitelist")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    whitelist = {}
-    for row in rows:
-        normalized = normalize_phone(row['phone_number'])
-        whitelist[normalized] = row['app_id']
-    return whitelist
+def db():
+    """
+    Return the bot's shared SQLite connection, opening it on first use.
+    The connection runs in autocommit mode with WAL enabled so the bot never
+    blocks the web app's writers between polls.
+    """
+    global _CONN
+    if _CONN is None:
+        # All bot queries are literal SQL with ? placeholders, so each one is
+        # prepared once and then reused from the statement cache every cycle
+        _CONN = sqlite3.connect(
+            DB_PATH, isolation_level=None, check_same_thread=False, cached_statements=256
+        )
+        _CONN.row_factory = sqlite3.Row
+        _CONN.executescript('''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=memory;
+            PRAGMA cache_size=-20000;
+            PRAGMA busy_timeout=5000;
+        ''')
+    return _CONN
+
+def close_db():
+    """Close the shared connection (called on bot shutdown)."""
+    global _CONN
+    if _CONN is not None:
+        _CONN.close()
+        _CONN = None
+
+def init_bot_db():
+    """Prepare the bot's tables once at startup."""
+    ensure_schema(DB_PATH)
 
-def normalize_phone(phone):
+    # One-shot migration for whitelist rows stored before numbers were
+    # normalized at ingest; rows that would collide are left untouched
+    db().create_function("normalize", 1, normalize_phone, deterministic=True)
+    db().execute(
+        'UPDATE OR IGNORE whitelist SET phone_number = normalize(phone_number) '
+        'WHERE phone_number != normalize(phone_number)'
+    )
+
+_whitelist_cache = (None, {})
+
+def get_whitelist():
     """
-    Normalize phone number to a consistent format.
-    Handles: +233XXXXXXXXX, 0XXXXXXXXX, 233XXXXXXXXX
-    Returns: 233XXXXXXXXX (no plus, no leading zero)
+    Fetch all whitelisted phone numbers, keyed by normalized number.
+    The result is cached until another connection (the web app or scraper)
+    commits to the database, which is what PRAGMA data_version tracks.
     """
-    if not phone:
-        return ""
-    
-    # Remove all non-digits
-    digits = re.sub(r'\D', '', phone)
+    global _whitelist_cache
+    version = db().execute("PRAGMA data_version").fetchone()[0]
+    if _whitelist_cache[0] == version:
+        return _whitelist_cache[1]
     
-    # Handle Ghana format
-    if digits.startswith('0') and len(digits) == 10:
-        digits = '233' + digits[1:]
-    elif digits.startswith('233') and len(digits) == 12:
-        pass  # Already correct
-    elif len(digits) == 9:
-        digits = '233' + digits
-    
-    return digits
+    # Numbers are normalized when the web app stores them (see init_bot_db)
+    rows = db().execute("SELECT phone_number, app_id FROM whitelist").fetchall()
+    whitelist = {row['phone_number']: row['app_id'] for row in rows}
+    _whitelist_cache = (version, whitelist)
+    return whitelist
 
-def is_already_approved(phone, group_name):
-    """Check if this phone was already approved for this group (idempotency)."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create tracking table if not exists
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS approvals_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone_number TEXT,
-            group_name TEXT,
-            approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(phone_number, group_name)
-        )
-    ''')
-    conn.commit()
-    
-    cursor.execute(
-        'SELECT 1 FROM approvals_log WHERE phone_number = ? AND group_name = ?',
-        (phone, group_name)
-    )
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+def load_approved_set():
+    """Load every (phone, group) pair we've already approved (idempotency)."""
+    rows = db().execute('SELECT phone_number, group_name FROM approvals_log')
+    return {(row[0], row[1]) for row in rows}
 
 def log_approval(phone, group_name):
     """Log that we approved this phone for this group."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            'INSERT OR IGNORE INTO approvals_log (phone_number, group_name) VALUES (?, ?)',
-            (phone, group_name)
-        )
-        conn.commit()
+        with _DB_LOCK:
+            db().execute(
+                'INSERT OR IGNORE INTO approvals_log (phone_number, group_name) VALUES (?, ?)',
+                (phone, group_name)
+            )
     except Exception as e:
         print(f"[!] Error logging approval: {e}")
-    finally:
-        conn.close()
 
 # --- WhatsApp Web Interaction ---
-def extract_phone_from_element(element):
+def extract_phone(title, text):
     """
-    Extract phone number from a pending request element.
+    Extract phone number from a pending request's title or text.
     WhatsApp typically shows the phone number in the title or text.
     """
-    try:
-        # Try to get phone from title attribute
-        title = element.get_attribute('title')
-        if title:
-            return normalize_phone(title)
-        
-        # Try to get from text content
-        text = element.text
-        # Look for phone pattern
-        phone_match = re.search(r'[\+]?[\d\s\-]{9,15}', text)
-        if phone_match:
-            return normalize_phone(phone_match.group())
-    except Exception:
-        pass
+    # Try the title attribute first
+    if title:
+        return normalize_phone(title)
+    
+    # Look for phone pattern in the text content
+    phone_match = _PHONE_RE.search(text)
+    if phone_match:
+        return normalize_phone(phone_match.group())
     return ""
 
-def process_group(driver, wait, group_name, whitelist):
+def process_group(driver, wait, group_name, whitelist, approved):
     """Process pending requests for a single group."""
     approvals = 0
+    ui_wait = WebDriverWait(driver, UI_TIMEOUT)
     
     try:
         # 1. Search for the group
@@ -148,49 +196,50 @@ def process_group(driver, wait, group_name, whitelist):
             (By.XPATH, '//div[@contenteditable="true"][@data-tab="3"]')
         ))
         search_box.click()
-        time.sleep(0.5)
         search_box.clear()
         search_box.send_keys(group_name)
-        time.sleep(2)
         
-        # 2. Click the group
+        # 2. Click the group once the chat list has narrowed to it
         try:
-            group_element = wait.until(EC.element_to_be_clickable(
+            group_element = ui_wait.until(EC.element_to_be_clickable(
                 (By.XPATH, f'//span[@title="{group_name}"]')
             ))
+            # Skip opening the group when its chat row shows no pending indicator,
+            # but only after the badge has been seen for it; until then (or if the
+            # row can't be found after markup drift) always do the full check
+            group_row = driver.find_elements(
+                By.XPATH, f'//span[@title="{group_name}"]/ancestor::div[@role="listitem"]'
+            )
+            if group_row:
+                if group_row[0].find_elements(By.XPATH, PENDING_BADGE_XPATH):
+                    _badge_seen.add(group_name)
+                elif group_name in _badge_seen:
+                    print(f"    -> No pending requests for {group_name}")
+                    return 0
             group_element.click()
             print(f"[*] Opened: {group_name}")
-            time.sleep(2)
         except TimeoutException:
             print(f"[!] Group not found: {group_name}")
             return 0
         
         # 3. Open group info (click header)
         try:
-            header = driver.find_element(By.CSS_SELECTOR, 'header')
+            # The chat list has its own header; #main is the opened conversation
+            header = ui_wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, '#main header')))
             header.click()
-            time.sleep(2)
-        except NoSuchElementException:
+        except TimeoutException:
             print("[!] Could not find group header")
             return 0
         
-        # 4. Look for "Pending participants" section
+        # 4. Look for "Pending participants" section as the drawer renders
         try:
-            # Various possible selectors for pending participants
-            pending_selectors = [
-                '//div[contains(text(), "Pending")]',
-                '//span[contains(text(), "Pending")]',
-                '//*[contains(text(), "Waiting")]',
-                '//div[contains(@class, "pending")]'
-            ]
-            
-            pending_btn = None
-            for selector in pending_selectors:
-                try:
-                    pending_btn = driver.find_element(By.XPATH, selector)
-                    break
-                except NoSuchElementException:
-                    continue
+            try:
+                pending_btn = WebDriverWait(driver, PENDING_TIMEOUT).until(EC.any_of(*[
+                    EC.element_to_be_clickable((By.XPATH, selector))
+                    for selector in PENDING_SELECTORS
+                ]))
+            except TimeoutException:
+                pending_btn = None
             
             if not pending_btn:
                 print(f"    -> No pending requests for {group_name}")
@@ -199,7 +248,16 @@ def process_group(driver, wait, group_name, whitelist):
                 return 0
             
             pending_btn.click()
-            time.sleep(2)
+            # Wait for the drawer to swap in its request list
+            try:
+                ui_wait.until(EC.any_of(
+                    EC.presence_of_element_located(
+                        (By.CSS_SELECTOR, f'{DRAWER_SELECTOR} [data-testid="cell-frame-container"]')
+                    ),
+                    EC.staleness_of(pending_btn)
+                ))
+            except TimeoutException:
+                pass  # Fall through to the alternative selector below
             
         except Exception as e:
             print(f"    -> No pending participants: {e}")
@@ -208,25 +266,13 @@ def process_group(driver, wait, group_name, whitelist):
         
         # 5. Process pending requests
         try:
-            # Find all pending request items
-            # Note: Exact selectors may change with WhatsApp Web updates
-            request_items = driver.find_elements(
-                By.CSS_SELECTOR, 
-                '[data-testid="cell-frame-container"]'
-            )
-            
-            if not request_items:
-                # Try alternative selector
-                request_items = driver.find_elements(
-                    By.XPATH,
-                    '//div[contains(@class, "participant")]'
-                )
+            request_items = driver.execute_script(PENDING_REQUESTS_JS, DRAWER_SELECTOR)
             
             print(f"    Found {len(request_items)} pending request(s)")
             
             for item in request_items[:MAX_APPROVALS_PER_CYCLE]:
                 try:
-                    phone = extract_phone_from_element(item)
+                    phone = extract_phone(item['title'], item['text'])
                     
                     if not phone:
                         print(f"       [?] Could not extract phone from request")
@@ -235,38 +281,23 @@ def process_group(driver, wait, group_name, whitelist):
                     # Check whitelist
                     if phone in whitelist:
                         # Check idempotency
-                        if is_already_approved(phone, group_name):
+                        if (phone, group_name) in approved:
                             print(f"       [=] Already approved: {phone}")
                             continue
                         
-                        # Find and click approve button
-                        try:
-                            approve_btn = item.find_element(
-                                By.CSS_SELECTOR, 
-                                '[data-testid="approve"]'
-                            )
-                            approve_btn.click()
-                            time.sleep(1)
-                            
-                            # Log the approval
-                            log_approval(phone, group_name)
-                            approvals += 1
-                            print(f"       [+] APPROVED: {phone} (ID: {whitelist[phone]})")
-                            
-                        except NoSuchElementException:
-                            # Try alternative approve button selector
-                            try:
-                                approve_btn = item.find_element(
-                                    By.XPATH, 
-                                    './/span[@data-icon="checkmark"]/..'
-                                )
-                                approve_btn.click()
-                                time.sleep(1)
-                                log_approval(phone, group_name)
-                                approvals += 1
-                                print(f"       [+] APPROVED: {phone}")
-                            except:
-                                print(f"       [!] Could not find approve button for {phone}")
+                        approve_btn = item['approve']
+                        if approve_btn is None:
+                            print(f"       [!] Could not find approve button for {phone}")
+                            continue
+                        
+                        approve_btn.click()
+                        wait_for_removal(driver, approve_btn, phone)
+                        
+                        # Log the approval
+                        log_approval(phone, group_name)
+                        approved.add((phone, group_name))
+                        approvals += 1
+                        print(f"       [+] APPROVED: {phone} (ID: {whitelist[phone]})")
                     else:
                         print(f"       [-] NOT in whitelist: {phone}")
                         
@@ -285,25 +316,32 @@ def process_group(driver, wait, group_name, whitelist):
     
     return approvals
 
+def wait_for_removal(driver, element, phone):
+    """Briefly wait for an approved request's button to drop out of the DOM."""
+    try:
+        WebDriverWait(driver, APPROVE_TIMEOUT).until(EC.staleness_of(element))
+    except TimeoutException:
+        print(f"       [?] Request for {phone} still shown {APPROVE_TIMEOUT}s after approving")
+
 def close_panel(driver):
     """Close the side info panel."""
     try:
         # Press Escape to close
-        from selenium.webdriver.common.keys import Keys
         driver.find_element(By.TAG_NAME, 'body').send_keys(Keys.ESCAPE)
         time.sleep(1)
     except:
         pass
 
-def run_bot():
-    """Main bot loop."""
-    print("=" * 50)
-    print("  ACES WhatsApp Auto-Approval Bot")
-    print("=" * 50)
-    print(f"[*] Monitoring groups: {GROUPS}")
-    print(f"[*] Check interval: {CHECK_INTERVAL}s")
-    print("[*] Opening Chrome - please wait for QR code...\n")
+def keep_alive(driver):
+    """Touch the chat search box so WhatsApp Web doesn't drop an idle session."""
+    try:
+        driver.find_element(By.XPATH, '//div[@contenteditable="true"][@data-tab="3"]').click()
+        driver.find_element(By.TAG_NAME, 'body').send_keys(Keys.ESCAPE)
+    except Exception:
+        pass
 
+def start_driver(profile_dir):
+    """Launch a Chrome session on its own persistent WhatsApp profile."""
     chrome_options = Options()
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
@@ -312,60 +350,96 @@ def run_bot():
     chrome_options.add_argument("--window-size=1200,800")
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
+    os.makedirs(profile_dir, exist_ok=True)
+    chrome_options.add_argument(f"--user-data-dir={profile_dir}")
     
-    print("[*] Launching Chrome...")
+    # Selenium Manager (4.11+) finds a cached chromedriver without a network check
+    return webdriver.Chrome(options=chrome_options)
+
+def run_bot():
+    """Main bot loop."""
+    print("=" * 50)
+    print("  ACES WhatsApp Auto-Approval Bot")
+    print("=" * 50)
+    print(f"[*] Monitoring groups: {GROUPS}")
+    print(f"[*] Check interval: {CHECK_INTERVAL}s (up to {MAX_CHECK_INTERVAL}s when idle)")
+    print("[*] Opening Chrome - please wait for QR code...\n")
+
+    init_bot_db()
+
+    # One browser per group so the groups can be scanned in parallel
+    drivers = []
+    print(f"[*] Launching {len(GROUPS)} Chrome session(s)...")
     try:
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install()), 
-            options=chrome_options
-        )
+        for i in range(len(GROUPS)):
+            drivers.append(start_driver(os.path.join(CHROME_PROFILE_DIR, f"session-{i}")))
     except Exception as e:
         print(f"[!] Failed to start Chrome: {e}")
         print("[!] Make sure Chrome browser is installed and up to date.")
+        for driver in drivers:
+            driver.quit()
+        close_db()
         return
     
     try:
-        driver.get("https://web.whatsapp.com")
-        
-        # Wait for login (up to 2 minutes for QR scan)
-        wait = WebDriverWait(driver, 120)
-        print("[*] Waiting for WhatsApp Web login...")
-        
-        wait.until(EC.presence_of_element_located(
-            (By.XPATH, '//div[@contenteditable="true"][@data-tab="3"]')
-        ))
+        waits = []
+        for group_name, driver in zip(GROUPS, drivers):
+            driver.get("https://web.whatsapp.com")
+            
+            # Wait for login (up to 2 minutes for QR scan)
+            wait = WebDriverWait(driver, 120)
+            print(f"[*] Waiting for WhatsApp Web login (session for {group_name})...")
+            
+            wait.until(EC.presence_of_element_located(
+                (By.XPATH, '//div[@contenteditable="true"][@data-tab="3"]')
+            ))
+            waits.append(wait)
         print("[*] Logged in successfully!\n")
 
         # Main monitoring loop
         cycle = 0
-        while True:
-            cycle += 1
-            print(f"\n{'='*40}")
-            print(f"[Cycle {cycle}] {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"{'='*40}")
-            
-            # Refresh whitelist each cycle
-            whitelist = get_whitelist()
-            print(f"[*] Whitelist has {len(whitelist)} verified numbers")
-            
-            total_approvals = 0
-            
-            for group_name in GROUPS:
-                approvals = process_group(driver, wait, group_name, whitelist)
-                total_approvals += approvals
-            
-            if total_approvals > 0:
-                print(f"\n[*] Total approved this cycle: {total_approvals}")
-            
-            print(f"\n[*] Sleeping for {CHECK_INTERVAL}s...")
-            time.sleep(CHECK_INTERVAL)
+        idle_streak = 0
+        with ThreadPoolExecutor(max_workers=len(GROUPS)) as pool:
+            while True:
+                cycle += 1
+                print(f"\n{'='*40}")
+                print(f"[Cycle {cycle}] {time.strftime('%Y-%m-%d %H:%M:%S')}")
+                print(f"{'='*40}")
+                
+                # Refresh whitelist each cycle
+                whitelist = get_whitelist()
+                print(f"[*] Whitelist has {len(whitelist)} verified numbers")
+                approved = load_approved_set()
+                
+                total_approvals = sum(pool.map(
+                    lambda driver, wait, group_name: process_group(
+                        driver, wait, group_name, whitelist, approved
+                    ),
+                    drivers, waits, GROUPS
+                ))
+                
+                if total_approvals > 0:
+                    print(f"\n[*] Total approved this cycle: {total_approvals}")
+                    idle_streak = 0
+                else:
+                    for driver in drivers:
+                        keep_alive(driver)
+                    if CHECK_INTERVAL * 2 ** idle_streak < MAX_CHECK_INTERVAL:
+                        idle_streak += 1
+                
+                # Back off exponentially while the groups are idle
+                sleep_for = min(CHECK_INTERVAL * 2 ** idle_streak, MAX_CHECK_INTERVAL)
+                print(f"\n[*] Sleeping for {sleep_for}s...")
+                time.sleep(sleep_for)
 
     except KeyboardInterrupt:
         print("\n[*] Bot stopped by user.")
     except Exception as e:
         print(f"\n[!] Critical Error: {e}")
     finally:
-        driver.quit()
+        for driver in drivers:
+            driver.quit()
+        close_db()
         print("[*] Browser closed.")
 
 if __name__ == "__main__":
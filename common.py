@@ -0,0 +1,122 @@
+"""
+Shared Helpers
+==============
+Code used by more than one of the web app, the scraper and the WhatsApp bot.
+"""
+
+import os
+import re
+import sqlite3
+
+_NONDIGIT_RE = re.compile(r'\D')
+
+# --- Database Schema ---
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS valid_students (
+        app_id TEXT PRIMARY KEY,
+        full_name TEXT,
+        programme TEXT,
+        category TEXT,
+        scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS whitelist (
+        phone_number TEXT PRIMARY KEY,
+        app_id TEXT,
+        FOREIGN KEY(app_id) REFERENCES valid_students(app_id)
+    )
+    ''',
+    # Written by the WhatsApp bot. UNIQUE(phone_number, group_name) doubles as
+    # the (phone, group) index and makes log_approval's INSERT OR IGNORE idempotent
+    '''
+    CREATE TABLE IF NOT EXISTS approvals_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone_number TEXT,
+        group_name TEXT,
+        approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(phone_number, group_name)
+    )
+    ''',
+]
+
+# One phone per student: /confirm upserts on app_id and /verify looks it up
+WHITELIST_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS uq_whitelist_app_id ON whitelist(app_id)'
+
+_schema_ready = set()
+
+
+def _dedupe_whitelist(conn):
+    """
+    One-time migration before uq_whitelist_app_id exists: older databases
+    allowed several phones per student, so keep only the latest one each.
+    """
+    has_index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_whitelist_app_id'"
+    ).fetchone()
+    if has_index:
+        return
+
+    removed = conn.execute('''
+        DELETE FROM whitelist WHERE app_id IS NOT NULL AND rowid NOT IN
+            (SELECT MAX(rowid) FROM whitelist WHERE app_id IS NOT NULL GROUP BY app_id)
+    ''').rowcount
+    if removed:
+        print(f"[*] Removed {removed} older whitelist phone(s) to keep one per student")
+
+
+def ensure_schema(db_path):
+    """
+    Create every table and index the services share, at most once per process.
+    BEGIN IMMEDIATE takes the write lock before anything is checked, so web
+    workers, the scraper and the bot starting together queue up instead of racing.
+    """
+    if db_path in _schema_ready:
+        return
+
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')  # Persists in the DB file
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            _dedupe_whitelist(conn)
+            conn.execute(WHITELIST_INDEX)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    _schema_ready.add(db_path)
+
+
+def digits_only(phone):
+    """Strip everything but digits from a phone number."""
+    return _NONDIGIT_RE.sub('', phone)
+
+
+def normalize_phone(phone):
+    """
+    Normalize phone number to a consistent format.
+    Handles: +233XXXXXXXXX, 0XXXXXXXXX, 233XXXXXXXXX
+    Returns: 233XXXXXXXXX (no plus, no leading zero)
+    """
+    if not phone:
+        return ""
+
+    # Remove all non-digits
+    digits = digits_only(phone)
+
+    # Handle Ghana format
+    if digits.startswith('0') and len(digits) == 10:
+        digits = '233' + digits[1:]
+    elif digits.startswith('233') and len(digits) == 12:
+        pass  # Already correct
+    elif len(digits) == 9:
+        digits = '233' + digits
+
+    return digits
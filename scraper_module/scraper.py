@@ -1,15 +1,23 @@
 import sqlite3
-import time
 import os
 import re
+import sys
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import requests
+from bs4 import BeautifulSoup
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException, ElementClickInterceptedException
+from selenium.common.exceptions import NoSuchElementException, ElementClickInterceptedException, TimeoutException
+
+# Shared helpers live at the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import ensure_schema
 
 # --- Configuration ---
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'students.db')
@@ -18,64 +26,196 @@ BASE_URL = "https://apps.knust.edu.gh/admissions/check/Home/Undergraduates"
 # We search for "Computer" to be safe, then filter for "Computer Eng" in Python
 # This handles "BSc. Computer Eng", "Computer Engineering", etc.
 SEARCH_TERM = "Computer"  
-TARGET_KEYWORDS = ["COMPUTER ENG", "COMPUTER ENGINEERING"] 
+TARGET_RE = re.compile(r'COMPUTER\s+ENG', re.IGNORECASE)  # Covers "Computer Eng" and "Computer Engineering"
+BATCH_SIZE = 500  # Max rows per INSERT transaction
+# One literal for every batch, so sqlite3 prepares it once per connection
+INSERT_STUDENT_SQL = '''
+    INSERT OR REPLACE INTO valid_students (app_id, full_name, programme, category)
+    VALUES (?, ?, ?, ?)
+'''
+
+CATEGORY_IDS = [
+    "v-pills-international-applicants-tab",
+    "v-pills-fee-paying-other-applicants-tab",
+    "v-pills-mature-applicants-tab",
+    "v-pills-wassce-applicants-tab",
+    "v-pills-fee-paying-wassce-applicants-tab",
+    "v-pills-less-endowed-applicants-tab",
+    "v-pills-nmtc-upgrade-tab"
+]
+MAX_WORKERS = min(len(CATEGORY_IDS), os.cpu_count() or 1)  # One headless Chrome per worker
+
+# Reads one DataTables page of the pane given as arguments[0] in a single
+# WebDriver call: every body cell's text, plus the "Next" button if it is
+# visible and enabled (null on the last page). Returns null with no table.
+PAGE_JS = """
+const pane = document.querySelector(arguments[0]);
+const table = pane && pane.querySelector('table.dataTable');
+if (!table) {
+    return null;
+}
+const rows = Array.from(table.querySelectorAll('tbody tr')).map(
+    r => Array.from(r.querySelectorAll('td')).map(c => c.innerText)
+);
+const next = Array.from(pane.querySelectorAll('.paginate_button.next')).find(
+    b => b.offsetParent !== null
+);
+return {rows: rows, next: next && !next.classList.contains('disabled') ? next : null};
+"""
+
+# True once every row in the pane's table matches the search term (arguments[1])
+# or DataTables shows its "no matching records" row
+FILTER_APPLIED_JS = """
+const rows = Array.from(document.querySelectorAll(arguments[0] + ' table.dataTable tbody tr'));
+const term = arguments[1].toLowerCase();
+return rows.length > 0 && rows.every(
+    r => r.querySelector('td.dataTables_empty') || r.innerText.toLowerCase().includes(term)
+);
+"""
+
+# Sets the search input (arguments[0]) to arguments[1] in one go and fires a
+# single input event, so DataTables filters once instead of on every keystroke
+SET_SEARCH_JS = """
+const el = arguments[0];
+el.value = arguments[1];
+el.dispatchEvent(new Event('input', {bubbles: true}));
+"""
+
+# Cell text of the pane's first table row, in the same shape as PAGE_JS rows
+FIRST_ROW_JS = """
+const row = document.querySelector(arguments[0] + ' table.dataTable tbody tr');
+return row ? Array.from(row.querySelectorAll('td')).map(c => c.innerText) : null;
+"""
 
 # --- Database Setup ---
 def init_db():
     try:
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS valid_students (
-                app_id TEXT PRIMARY KEY,
-                full_name TEXT,
-                programme TEXT,
-                category TEXT,
-                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS whitelist (
-                phone_number TEXT PRIMARY KEY,
-                app_id TEXT,
-                FOREIGN KEY(app_id) REFERENCES valid_students(app_id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        ensure_schema(DB_PATH)
         print(f"[*] Database initialized at {DB_PATH}")
     except Exception as e:
         print(f"[!] DB Init Error: {e}")
 
-def save_student(app_id, name, programme, category):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def get_db_connection():
+    """Open the scraper's connection in WAL mode so bulk writes don't block the web app."""
+    # SQL stays literal (no f-strings) so it hits sqlite3's statement cache
+    conn = sqlite3.connect(DB_PATH, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def save_students(conn, cur, batch):
+    """Insert a batch of scraped rows in a single transaction on a reused cursor."""
     try:
-        c.execute('''
-            INSERT OR REPLACE INTO valid_students (app_id, full_name, programme, category)
-            VALUES (?, ?, ?, ?)
-        ''', (app_id, name, programme, category))
-        conn.commit()
+        with conn:
+            cur.executemany(INSERT_STUDENT_SQL, batch)
         return True
     except Exception as e:
-        print(f"[!] Error saving {name}: {e}")
+        print(f"[!] Error saving {len(batch)} students: {e}")
         return False
+
+def save_in_batches(conn, cur, rows):
+    """Save rows BATCH_SIZE at a time; returns how many were written."""
+    saved = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        if save_students(conn, cur, batch):
+            saved += len(batch)
+    return saved
+
+def db_writer(rows_queue, saved_counts):
+    """
+    Drain scraped row lists into SQLite on a background thread, so commits
+    overlap with the next category's scrape. Stops at a None sentinel.
+    """
+    # sqlite3 connections belong to the thread that opened them
+    conn = get_db_connection()
+    cur = conn.cursor()  # Kept for the whole session
+    try:
+        while True:
+            rows = rows_queue.get()
+            if rows is None:
+                break
+            saved_counts.append(save_in_batches(conn, cur, rows))
     finally:
         conn.close()
 
 def is_target_programme(prog_text):
-    """Check if programme matches our target criteria."""
+    """
+    Check if programme matches our target criteria.
+    TARGET_RE is case-insensitive, so no per-row copy of the text is made.
+    Still needed when DataTables already filtered: the static HTML path and a
+    filter that never settled both hand over unfiltered rows.
+    """
     if not prog_text:
         return False
-    prog_upper = prog_text.upper()
-    return any(keyword in prog_upper for keyword in TARGET_KEYWORDS)
+    return TARGET_RE.search(prog_text) is not None
 
 # --- Scraper Logic ---
-def run_scraper():
-    print("[*] Starting Comprehensive Scraper...")
-    print(f"[*] Expecting at least 438 students.")
+def parse_table_rows(pane, cat_id):
+    """
+    Pull target students out of a server-rendered category pane.
+    Returns None when the pane's table has no data rows in the HTML.
+    """
+    found = []
+    has_rows = False
+    for tr in pane.select("table tbody tr"):
+        cols = [td.get_text(" ", strip=True) for td in tr.find_all("td")]
+        if len(cols) < 5:
+            continue # Header or empty
+        has_rows = True
+        
+        # Columns: #, ID, Name, Programme, Action
+        if is_target_programme(cols[3]):
+            found.append((cols[1], cols[2], cols[3], cat_id))
+    return found if has_rows else None
+
+def fetch_static_tables():
+    """
+    Fetch the admissions page once over plain HTTP and parse every category
+    whose table is already in the HTML. Returns {cat_id: rows}; categories
+    missing from the result (e.g. filled in by AJAX) still need the browser.
+    """
+    try:
+        response = requests.get(BASE_URL, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"[!] Static fetch failed, using the browser for every category: {e}")
+        return {}
+    
+    soup = BeautifulSoup(response.text, "lxml")
+    tables = {}
+    for cat_id in CATEGORY_IDS:
+        pane = soup.find(id=cat_id.replace('-tab', ''))
+        if pane is None:
+            continue
+        rows = parse_table_rows(pane, cat_id)
+        if rows is not None:
+            tables[cat_id] = rows
+    return tables
 
+def show_all_rows(pane_element):
+    """
+    Switch the pane's DataTable to its largest page size ("All" when offered)
+    so the filtered results don't get cut off at the default 10 rows.
+    Returns True only if every row now renders on a single page.
+    """
+    try:
+        length_select = Select(pane_element.find_element(By.CSS_SELECTOR, "select[name$='_length']"))
+    except NoSuchElementException:
+        return False
+    
+    values = [opt.get_attribute("value") for opt in length_select.options]
+    if "-1" in values:
+        length_select.select_by_value("-1")
+        return True
+    
+    numeric = [v for v in values if v.lstrip("-").isdigit()]
+    if numeric:
+        length_select.select_by_value(max(numeric, key=int))
+    return False
+
+def start_driver():
+    """Launch a headless Chrome tuned for reading table text."""
     chrome_options = Options()
     # chrome_options.add_argument("--headless=new") # Run visible to debug if needed, or headless
     chrome_options.add_argument("--headless=new") 
@@ -83,186 +223,189 @@ def run_scraper():
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--window-size=1920,1080")
     chrome_options.add_argument("--log-level=3")
+    # Only cell text matters: skip images and don't wait for subresources
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2
+    })
+    chrome_options.page_load_strategy = "eager"
+
+    # Selenium Manager (4.11+) resolves and caches chromedriver locally
+    return webdriver.Chrome(options=chrome_options)
+
+def scrape_category(cat_id):
+    """
+    Scrape one admission category in its own browser.
+    Runs in a worker process, so it only collects rows; the parent saves them.
+    Returns a list of (app_id, name, programme, category) tuples.
+    """
+    print(f"[-] Processing Category: {cat_id}")
+    found = []
+
+    try:
+        driver = start_driver()
+    except Exception as e:
+        print(f"    [!] Could not start Chrome for {cat_id}: {e}")
+        return found
 
-    driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=chrome_options)
-    
     try:
         driver.get(BASE_URL)
-        print(f"[*] Loaded {BASE_URL}")
         wait = WebDriverWait(driver, 20)
 
-        category_ids = [
-            "v-pills-international-applicants-tab",
-            "v-pills-fee-paying-other-applicants-tab",
-            "v-pills-mature-applicants-tab",
-            "v-pills-wassce-applicants-tab",
-            "v-pills-fee-paying-wassce-applicants-tab",
-            "v-pills-less-endowed-applicants-tab",
-            "v-pills-nmtc-upgrade-tab"
-        ]
-
-        total_saved_session = 0
+        # 1. Activate Tab
+        tab_element = wait.until(EC.element_to_be_clickable((By.ID, cat_id)))
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", tab_element)
+        try:
+            tab_element.click()
+        except ElementClickInterceptedException:
+            driver.execute_script("arguments[0].click();", tab_element)
+        
+        # 2. Find Search Box for this pane
+        pane_id = cat_id.replace('-tab', '')
+        pane_selector = f"#{pane_id}"
+        
+        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, pane_selector)))
+        pane_element = driver.find_element(By.CSS_SELECTOR, pane_selector)
+        
+        # Wait for DataTables to render the table's rows
+        wait.until(EC.presence_of_element_located(
+            (By.CSS_SELECTOR, f"{pane_selector} table.dataTable tbody tr")
+        ))
+        
+        # Show every row on one page; pagination below is only the fallback
+        single_page = show_all_rows(pane_element)
+        if not single_page:
+            print(f"    [!] No 'All' page size for {cat_id}, paginating instead")
+        
+        # DataTables search input
+        # Usually: div.dataTables_filter input
+        try:
+            search_box = pane_element.find_element(By.CSS_SELECTOR, "input[type='search']")
+        except NoSuchElementException:
+            # Sometimes structure is slightly different or global
+            # Try finding ANY search input visible
+            inputs = pane_element.find_elements(By.TAG_NAME, "input")
+            search_box = None
+            for inp in inputs:
+                if inp.get_attribute("type") == "search":
+                    search_box = inp
+                    break
+            if not search_box:
+                print(f"    [!] Could not find search box for {cat_id}")
+                return found
 
-        for cat_id in category_ids:
-            print(f"\n{'='*50}")
-            print(f"[-] Processing Category: {cat_id}")
-            print(f"{'='*50}")
+        # 3. Enter Broad Search Term
+        driver.execute_script(SET_SEARCH_JS, search_box, SEARCH_TERM)
+        
+        # Wait for filter to apply
+        try:
+            wait.until(lambda d: d.execute_script(FILTER_APPLIED_JS, pane_selector, SEARCH_TERM))
+        except TimeoutException:
+            print(f"    [!] Filter didn't settle for {cat_id}; reading rows as shown")
 
+        # 4. Pagination Loop
+        while True:
+            # Query the pane fresh on every page so nothing goes stale
             try:
-                # 1. Activate Tab
-                tab_element = wait.until(EC.element_to_be_clickable((By.ID, cat_id)))
-                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", tab_element)
-                time.sleep(1)
-                try:
-                    tab_element.click()
-                except ElementClickInterceptedException:
-                    driver.execute_script("arguments[0].click();", tab_element)
-                
-                # 2. Find Search Box for this pane
-                pane_id = cat_id.replace('-tab', '')
-                pane_selector = f"#{pane_id}"
-                
-                wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, pane_selector)))
-                pane_element = driver.find_element(By.CSS_SELECTOR, pane_selector)
-                
-                # Wait for table to be ready (look for input)
-                time.sleep(2)
+                page = driver.execute_script(PAGE_JS, pane_selector)
+            except Exception as e:
+                print(f"    [!] Error reading table in {cat_id}: {e}")
+                break
+            if page is None:
+                print(f"    [!] Could not find table for {cat_id}")
+                break
+
+            for cols in page['rows']:
+                if len(cols) < 5:
+                    continue # Header or empty
                 
-                # DataTables search input
-                # Usually: div.dataTables_filter input
-                try:
-                    search_box = pane_element.find_element(By.CSS_SELECTOR, "input[type='search']")
-                except NoSuchElementException:
-                    # Sometimes structure is slightly different or global
-                    # Try finding ANY search input visible
-                    inputs = pane_element.find_elements(By.TAG_NAME, "input")
-                    search_box = None
-                    for inp in inputs:
-                        if inp.get_attribute("type") == "search":
-                            search_box = inp
-                            break
-                    if not search_box:
-                        print(f"    [!] Could not find search box for {cat_id}")
-                        continue
-
-                # 3. Enter Broad Search Term
-                search_box.clear()
-                search_box.send_keys(SEARCH_TERM)
-                print(f"    -> Searching for '{SEARCH_TERM}'...")
+                # Columns: #, ID, Name, Programme, Action
+                app_id = cols[1].strip()
+                name = cols[2].strip()
+                prog = cols[3].strip()
                 
-                # Wait for filter to apply
-                time.sleep(3)
+                # Filter strictly for Computer Engineering
+                if is_target_programme(prog):
+                    found.append((app_id, name, prog, cat_id))
 
-                # 4. Pagination Loop
-                page_num = 1
-                cat_count = 0
-                
-                while True:
-                    # Scrape current page rows
-                    try:
-                        # Re-locate table to avoid stale elements
-                        updated_pane = driver.find_element(By.CSS_SELECTOR, pane_selector)
-                        table = updated_pane.find_element(By.CSS_SELECTOR, "table.dataTable")
-                        rows = table.find_elements(By.TAG_NAME, "tr")
-                    except Exception as e:
-                        print(f"    [!] Error locating table: {e}")
-                        break
-
-                    rows_scraped_on_page = 0
-                    for row in rows:
-                        try:
-                            cols = row.find_elements(By.TAG_NAME, "td")
-                            if len(cols) < 5:
-                                continue # Header or empty
-                            
-                            # Columns: #, ID, Name, Programme, Action
-                            app_id = cols[1].text.strip()
-                            name = cols[2].text.strip()
-                            prog = cols[3].text.strip()
-                            
-                            # Filter strictly for Computer Engineering
-                            if is_target_programme(prog):
-                                if save_student(app_id, name, prog, cat_id):
-                                    cat_count += 1
-                                    rows_scraped_on_page += 1
-                                    # Optional: print specific students or just progress
-                                    # print(f"       + Saved: {name} ({app_id})")
-                        except StaleElementReferenceException:
-                            continue # Skip row if stale
-
-                    # print(f"    -> Page {page_num}: Found {rows_scraped_on_page} relevant students")
-
-                    # Check for Next Button
-                    # Selector: .paginate_button.next
-                    # It must NOT have class 'disabled'
-                    try:
-                        # Need to find the pagination controls SPECIFIC to this pane
-                        # Usually follows the table
-                        # ID for wrapper often ends in _wrapper
-                        
-                        # Simpler: Find visible "Next" button inside this pane (or global if ID based)
-                        # DataTables IDs are dynamic (DataTables_Table_0_paginate)
-                        
-                        # Find the pagination container within the pane
-                        # Usually: .dataTables_paginate
-                        
-                        # Finding the "Next" button
-                        next_btn_candidates = updated_pane.find_elements(By.CSS_SELECTOR, ".paginate_button.next")
-                        
-                        next_btn = None
-                        for btn in next_btn_candidates:
-                            if btn.is_displayed():
-                                next_btn = btn
-                                break
-                        
-                        if not next_btn:
-                            # print("    [|] No Next button found (single page?)")
-                            break
-                        
-                        # Check if disabled
-                        classes = next_btn.get_attribute("class")
-                        if "disabled" in classes:
-                            # print("    [|] Next button disabled - Reached last page.")
-                            break
-                        
-                        # Click Next
-                        # print(f"    [>] Moving to Page {page_num + 1}...")
-                        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_btn)
-                        time.sleep(0.5)
-                        next_btn.click()
-                        
-                        page_num += 1
-                        time.sleep(2) # Wait for page load
-                        
-                    except Exception as e:
-                        print(f"    [!] Pagination error: {e}")
-                        break
-
-                print(f"    [+] Category Complete. Total: {cat_count}")
-                total_saved_session += cat_count
+            if single_page:
+                break # Every filtered row was on this page
 
+            next_btn = page['next']
+            if next_btn is None:
+                break # Reached last page
+            
+            old_first_row = page['rows'][0] if page['rows'] else None
+            try:
+                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_btn)
+                next_btn.click()
+                # Wait for the next page to replace this one
+                wait.until(lambda d: d.execute_script(FIRST_ROW_JS, pane_selector) != old_first_row)
             except Exception as e:
-                print(f"    [!] Critical error in category {cat_id}: {e}")
+                print(f"    [!] Pagination error in {cat_id}: {e}")
+                break
 
-        print("\n" + "="*30)
-        print(f"[*] SCRAPE COMPLETE.")
-        print(f"[*] Total Students Found in this session: {total_saved_session}")
-        
-        # Verify Total DB Count
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM valid_students")
-        final_count = c.fetchone()[0]
-        print(f"[*] Total Database Count: {final_count}")
-        conn.close()
-        
-        print("="*30)
+        print(f"    [+] {cat_id} complete. Found: {len(found)}")
 
     except Exception as e:
-        print(f"[!] Critical Driver Error: {e}")
+        print(f"    [!] Critical error in category {cat_id}: {e}")
     finally:
         driver.quit()
 
+    return found
+
+def run_scraper():
+    print("[*] Starting Comprehensive Scraper...")
+    print(f"[*] Expecting at least 438 students.")
+
+    # One writer thread owns the DB while this thread keeps scraping
+    rows_queue = queue.Queue()
+    saved_counts = []
+    writer = threading.Thread(target=db_writer, args=(rows_queue, saved_counts), daemon=True)
+    writer.start()
+    
+    try:
+        # Cheap path first: read whatever the server already rendered
+        static_tables = fetch_static_tables()
+        for cat_id, rows in static_tables.items():
+            print(f"    [+] {cat_id} read from page HTML. Found: {len(rows)}")
+            rows_queue.put(rows)
+
+        remaining = [cat_id for cat_id in CATEGORY_IDS if cat_id not in static_tables]
+        if remaining:
+            workers = min(len(remaining), MAX_WORKERS)
+            print(f"[*] Scraping {len(remaining)} categories with {workers} browser(s)...")
+            # Selenium sessions aren't thread-safe, so each category gets its own process.
+            # Spawn rather than fork: the writer thread may be mid-commit right now
+            spawn = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=spawn) as executor:
+                for rows in executor.map(scrape_category, remaining):
+                    rows_queue.put(rows)
+
+    except Exception as e:
+        print(f"[!] Critical Scraper Error: {e}")
+    finally:
+        # Let the writer flush everything queued before counting
+        rows_queue.put(None)
+        writer.join()
+
+    print("\n" + "="*30)
+    print(f"[*] SCRAPE COMPLETE.")
+    print(f"[*] Total Students Found in this session: {sum(saved_counts)}")
+    
+    # Verify Total DB Count
+    conn = get_db_connection()
+    try:
+        final_count = conn.execute("SELECT COUNT(*) FROM valid_students").fetchone()[0]
+        print(f"[*] Total Database Count: {final_count}")
+    except Exception as e:
+        print(f"[!] Could not count students: {e}")
+    finally:
+        conn.close()
+    
+    print("="*30)
+
 if __name__ == "__main__":
     init_db()
     run_scraper()
@@ -9,8 +9,14 @@ from flask import Flask, render_template, request, redirect, url_for, flash, ses
 import sqlite3
 import os
 import re
+import sys
+import threading
 from dotenv import load_dotenv
 
+# Shared helpers live at the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import digits_only, ensure_schema, normalize_phone
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -22,50 +28,54 @@ DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'stud
 WHATSAPP_LINK_OFFICIAL = os.getenv('WHATSAPP_LINK_OFFICIAL', '')
 WHATSAPP_LINK_UNOFFICIAL = os.getenv('WHATSAPP_LINK_UNOFFICIAL', '')
 
+# Every digit string validate_phone accepts: local 0XXXXXXXXX, international
+# 233XXXXXXXXX, or 9-12 digits with neither prefix
+VALID_PHONE_RE = re.compile(r'0\d{9}|233\d{9}|(?!0|233)\d{9,12}')
+
+
+def prepare_db():
+    """
+    One-time setup at import: the shared schema (including the unique
+    whitelist.app_id index /confirm's upsert needs) and WAL mode so /verify
+    reads don't block /confirm writes.
+    """
+    try:
+        ensure_schema(DB_PATH)
+    except sqlite3.Error as e:
+        print(f"[!] Database setup error: {e}")
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
 
+_local = threading.local()
 
-def normalize_phone(phone):
+
+def get_db_connection():
     """
-    Normalize phone number to consistent format for matching.
-    Handles: +233XXXXXXXXX, 0XXXXXXXXX, 233XXXXXXXXX
-    Returns: 233XXXXXXXXX
+    Return this worker thread's connection, opening it on first use.
+    Connections stay open for the life of the worker, so routes must not close them.
     """
-    if not phone:
-        return ""
-    
-    # Remove all non-digits
-    digits = re.sub(r'\D', '', phone)
-    
-    # Handle Ghana format
-    if digits.startswith('0') and len(digits) == 10:
-        digits = '233' + digits[1:]
-    elif digits.startswith('233') and len(digits) == 12:
-        pass  # Already correct
-    elif len(digits) == 9:
-        digits = '233' + digits
-    
-    return digits
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # Route queries must be literal, parameterized SQL to stay in the statement cache
+        conn = sqlite3.connect(DB_PATH, cached_statements=256, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # Per-connection settings; safe with WAL and avoids a full fsync per commit
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA busy_timeout=5000')
+        _local.conn = conn
+    return conn
 
 
-def is_already_verified(app_id):
-    """Check if this application ID already has a phone number registered."""
-    conn = get_db_connection()
-    result = conn.execute(
-        'SELECT phone_number FROM whitelist WHERE app_id = ?', 
-        (app_id,)
-    ).fetchone()
-    conn.close()
-    return result is not None
+prepare_db()
 
 
 def validate_phone(phone):
     """Validate phone number format."""
-    digits = re.sub(r'\D', '', phone)
+    digits = digits_only(phone)
+    
+    # Common case: one match and done; the checks below only pick the error message
+    if VALID_PHONE_RE.fullmatch(digits):
+        return True, ""
     
     # Must be 9-12 digits
     if len(digits) < 9 or len(digits) > 12:
@@ -98,16 +108,21 @@ def verify_student():
     # Remove any spaces or dashes from ID
     app_id = re.sub(r'[\s\-]', '', app_id)
     
+    # One query for both the admission record and any registered phone
     conn = get_db_connection()
     student = conn.execute(
-        'SELECT * FROM valid_students WHERE app_id = ?', 
+        '''
+        SELECT s.app_id, s.full_name, s.programme, w.phone_number
+        FROM valid_students s
+        LEFT JOIN whitelist w ON w.app_id = s.app_id
+        WHERE s.app_id = ?
+        ''',
         (app_id,)
     ).fetchone()
-    conn.close()
     
     if student:
         # Check if already verified (idempotency)
-        if is_already_verified(app_id):
+        if student['phone_number'] is not None:
             flash("You have already verified! Use the links you received earlier.", "info")
             return render_template('success.html', 
                                    whatsapp_link_official=WHATSAPP_LINK_OFFICIAL,
@@ -148,25 +163,22 @@ def confirm_identity():
         try:
             conn = get_db_connection()
             
-            # Check if this phone is already used by someone else
-            existing = conn.execute(
-                'SELECT app_id FROM whitelist WHERE phone_number = ? AND app_id != ?',
-                (normalized_phone, app_id)
-            ).fetchone()
-            
-            if existing:
-                conn.close()
+            # Save to whitelist; re-verification replaces the student's number.
+            # The with-block rolls back on error so the shared connection stays usable.
+            try:
+                with conn:
+                    conn.execute(
+                        '''
+                        INSERT INTO whitelist (phone_number, app_id) VALUES (?, ?)
+                        ON CONFLICT(app_id) DO UPDATE SET phone_number = excluded.phone_number
+                        ''',
+                        (normalized_phone, app_id)
+                    )
+            except sqlite3.IntegrityError:
+                # app_id conflicts are upserted, so only the phone can collide
                 flash("This phone number is already registered by another student.", "error")
                 return render_template('confirm.html', name=name)
             
-            # Save to whitelist (INSERT OR REPLACE handles re-verification)
-            conn.execute(
-                'INSERT OR REPLACE INTO whitelist (phone_number, app_id) VALUES (?, ?)', 
-                (normalized_phone, app_id)
-            )
-            conn.commit()
-            conn.close()
-            
             # Clear session
             session.pop('verified_app_id', None)
             session.pop('verified_name', None)
@@ -190,7 +202,6 @@ def health_check():
     try:
         conn = get_db_connection()
         count = conn.execute('SELECT COUNT(*) FROM valid_students').fetchone()[0]
-        conn.close()
         return {"status": "healthy", "students_in_db": count}
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}, 500